@@ -1,20 +1,37 @@
 """
 Agent backend that connects to Blender MCP server and OpenRouter LLM.
 """
+# Must run before anything imports socket/ssl/threading so that requests,
+# pymongo and the tool pool all yield to other greenlets while waiting on I/O.
+from gevent import monkey
+monkey.patch_all()
+
 from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
+import orjson
 import os
-from typing import List, Dict, Any
+import time
+import base64
+import hashlib
+import hmac
+import threading
+from typing import List, Dict, Any, Iterator, Optional
 import logging
 import jwt
 import bcrypt
+import gevent
+from gevent.queue import Queue, Empty
+from gevent.threadpool import ThreadPool
 from pymongo import MongoClient
-from functools import wraps
+from functools import wraps, lru_cache
 import datetime
 from bson import ObjectId
-from blender_client import BlenderMCPClient
+from cachetools import TTLCache
+from blender_client import BlenderMCPClient, PRIMITIVE_TOOLS
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -28,10 +45,21 @@ OPENROUTER_MODEL = os.getenv('OPENROUTER_MODEL', 'alibaba/tongyi-deepresearch-30
 ORCHESTRATOR_URL = os.getenv('ORCHESTRATOR_URL', 'http://localhost:5001')
 MONGO_URI = os.getenv('MONGO_URI', 'mongodb://localhost:27017/altan')
 JWT_SECRET = os.getenv('JWT_SECRET', 'super-secret-key')
+JWT_CACHE_ENABLED = os.getenv('JWT_CACHE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+JWT_CACHE_TTL = 30  # seconds
+CHAT_HISTORY_WINDOW = int(os.getenv('CHAT_HISTORY_WINDOW', '40'))  # messages sent to the LLM
+LOGIN_CACHE_ENABLED = os.getenv('LOGIN_CACHE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
 
 # Database
 try:
-    mongo_client = MongoClient(MONGO_URI)
+    mongo_client = MongoClient(
+        MONGO_URI,
+        maxPoolSize=50,
+        minPoolSize=5,
+        waitQueueTimeoutMS=2000,
+        retryWrites=True,
+        serverSelectionTimeoutMS=3000
+    )
     db = mongo_client.get_database()
     users_collection = db.users
     chats_collection = db.chats
@@ -39,6 +67,66 @@ try:
 except Exception as e:
     logger.error(f"Failed to connect to MongoDB: {e}")
 
+# Indexes for the per-request lookups (login by username, chat by user_id)
+try:
+    users_collection.create_index('username', unique=True)
+    chats_collection.create_index('user_id', unique=True)
+except Exception as e:
+    logger.warning(f"Failed to create MongoDB indexes: {e}")
+
+# HS256 key as bytes so PyJWT doesn't re-encode it per call, and only the
+# claims we actually issue are checked.
+_JWT_KEY = JWT_SECRET.encode()
+_JWT_DECODE_OPTIONS = {
+    "require": ["exp"],
+    "verify_aud": False,
+    "verify_iss": False,
+    "verify_nbf": False,
+    "verify_iat": False
+}
+
+# Verified tokens -> (user doc, token exp). Keyed by a hash so raw tokens are never stored.
+_token_cache = TTLCache(maxsize=10000, ttl=JWT_CACHE_TTL)
+_token_cache_lock = threading.Lock()
+
+
+def _token_cache_key(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()[:32]
+
+
+def _token_alg(token: str) -> Optional[str]:
+    """Read the signing algorithm from a JWT header without verifying the token."""
+    header = token.split('.', 1)[0]
+    try:
+        return orjson.loads(base64.urlsafe_b64decode(header + '=' * (-len(header) % 4))).get('alg')
+    except (ValueError, AttributeError):
+        return None
+
+
+@lru_cache(maxsize=4096)
+def _oid(user_id: str) -> ObjectId:
+    """Parse a user_id claim, memoized since the same users send many requests."""
+    return ObjectId(user_id)
+
+
+# bcrypt's cost loop releases the GIL; running it on real OS threads keeps
+# the gevent hub free to serve other requests while a password is hashed.
+bcrypt_pool = ThreadPool(4)
+
+# Recently verified credentials -> user_id. Only successful logins are cached, so
+# failed guesses always pay the full bcrypt cost.
+_login_cache = TTLCache(maxsize=1024, ttl=60)
+_login_cache_lock = threading.Lock()
+# Per-process key so the cache never holds a plain, crackable password hash
+_login_cache_secret = os.urandom(32)
+
+
+def _login_cache_key(username: str, password: str) -> str:
+    # Encode as a JSON pair so ("a:b", "c") and ("a", "b:c") can't collide
+    credentials = orjson.dumps([username, password])
+    return hmac.new(_login_cache_secret, credentials, hashlib.sha256).hexdigest()
+
+
 # Auth Decorator
 def token_required(f):
     @wraps(f)
@@ -52,13 +140,32 @@ def token_required(f):
         if not token:
             return jsonify({'message': 'Token is missing!'}), 401
         
-        try:
-            data = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
-            current_user = users_collection.find_one({'_id': ObjectId(data['user_id'])})
-            if not current_user:
-                 return jsonify({'message': 'Token is invalid!'}), 401
-        except Exception as e:
-            return jsonify({'message': 'Token is invalid!', 'error': str(e)}), 401
+        current_user = None
+        if JWT_CACHE_ENABLED:
+            cache_key = _token_cache_key(token)
+            with _token_cache_lock:
+                cached = _token_cache.get(cache_key)
+            # The cache TTL is fixed; entries must also not outlive the token itself
+            if cached and cached[1] > time.time():
+                current_user = cached[0]
+        
+        if current_user is None:
+            # Cheap header check rejects alg=none and other junk before the HMAC and DB lookup
+            if _token_alg(token) != 'HS256':
+                return jsonify({'message': 'Token is invalid!'}), 401
+            
+            try:
+                data = jwt.decode(token, _JWT_KEY, algorithms=["HS256"], options=_JWT_DECODE_OPTIONS)
+                current_user = users_collection.find_one({'_id': _oid(data['user_id'])})
+                if not current_user:
+                     return jsonify({'message': 'Token is invalid!'}), 401
+            except Exception as e:
+                return jsonify({'message': 'Token is invalid!', 'error': str(e)}), 401
+            
+            if JWT_CACHE_ENABLED:
+                exp_ts = data.get('exp', time.time() + JWT_CACHE_TTL)
+                with _token_cache_lock:
+                    _token_cache[cache_key] = (current_user, min(exp_ts, time.time() + JWT_CACHE_TTL))
         
         return f(current_user, *args, **kwargs)
     
@@ -68,13 +175,56 @@ def token_required(f):
 # Initialize Blender client
 blender_client = BlenderMCPClient(ORCHESTRATOR_URL)
 
+# Tools that reset or read the whole scene and so must observe every earlier call
+SCENE_WIDE_TOOLS = {'initialize_scene', 'clear_scene', 'render_scene', 'list_objects'}
+
+
+def tool_calls_are_independent(calls: List[tuple]) -> bool:
+    """Check whether (name, arguments) tool calls can run in any order."""
+    if len(calls) < 2:
+        return False
+    
+    # Every object name created or targeted so far. Two calls touching the same name
+    # (create then use, two writes, two creations) depend on their order.
+    seen_names = set()
+    created_unnamed = False
+    for name, args in calls:
+        if name in SCENE_WIDE_TOOLS:
+            return False
+        
+        # Unnamed objects get Blender's default names, so any reference after one is suspect
+        target = args.get('object_name')
+        if target:
+            if target in seen_names or created_unnamed:
+                return False
+            seen_names.add(target)
+        
+        if name.startswith('add_'):
+            new_name = args.get('name')
+            if new_name:
+                if new_name in seen_names:
+                    return False
+                seen_names.add(new_name)
+            else:
+                created_unnamed = True
+    
+    return True
+
+# Keep-alive session so OpenRouter's TLS handshake is paid once, not per call
+openrouter_session = requests.Session()
+openrouter_session.headers.update({
+    "Authorization": f"Bearer {OPENROUTER_API_KEY}",
+    "Content-Type": "application/json"
+})
+openrouter_session.mount('https://', HTTPAdapter(
+    pool_connections=10,
+    pool_maxsize=50,
+    max_retries=Retry(total=2, backoff_factor=0.3)
+))
+
+
 def call_openrouter(messages: List[Dict[str, Any]], tools: List[Dict[str, Any]] = None, stream: bool = False) -> Any:
     """Call OpenRouter API."""
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    
     payload = {
         "model": OPENROUTER_MODEL,
         "messages": messages,
@@ -86,9 +236,8 @@ def call_openrouter(messages: List[Dict[str, Any]], tools: List[Dict[str, Any]]
         payload["tool_choice"] = "auto"
     
     try:
-        response = requests.post(
+        response = openrouter_session.post(
             "https://openrouter.ai/api/v1/chat/completions",
-            headers=headers,
             json=payload,
             timeout=60,
             stream=stream
@@ -104,6 +253,130 @@ def call_openrouter(messages: List[Dict[str, Any]], tools: List[Dict[str, Any]]
         raise
 
 
+# Upper bound for a single upstream SSE line; deltas are normally a few hundred bytes
+MAX_SSE_LINE_BYTES = 1024 * 1024
+
+
+def iter_stream_deltas(response) -> Iterator[Dict[str, Any]]:
+    """Yield the delta of each chunk of an OpenRouter SSE stream as it arrives."""
+    # chunk_size=None hands data over as soon as the socket delivers it
+    # instead of blocking until a fixed-size read fills up.
+    for line in response.iter_lines(chunk_size=None):
+        # Blank separators and ": keep-alive" comments are dropped on the raw bytes
+        if not line or not line.startswith(b"data: "):
+            continue
+        
+        if line == b"data: [DONE]":
+            break
+        
+        if len(line) > MAX_SSE_LINE_BYTES:
+            logger.warning("Skipping oversized SSE frame (%d bytes)", len(line))
+            continue
+        
+        try:
+            chunk = orjson.loads(line[6:])
+        except orjson.JSONDecodeError:
+            logger.warning("Skipping malformed SSE frame: %r", line[:200])
+            continue
+        
+        choices = chunk.get('choices')
+        if choices:
+            yield choices[0].get('delta', {})
+
+
+def sse_event(payload: Dict[str, Any]) -> bytes:
+    """Encode a payload as a single SSE data frame."""
+    return b"data: " + orjson.dumps(payload) + b"\n\n"
+
+
+class _ToolCallBuffer:
+    """Accumulates the streamed fragments of a single tool call."""
+    __slots__ = ('id', 'name', 'arguments')
+    
+    def __init__(self):
+        self.id = ""
+        self.name = ""
+        self.arguments = ""
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the tool call in OpenRouter's schema."""
+        return {
+            "id": self.id,
+            "type": "function",
+            "function": {"name": self.name, "arguments": self.arguments}
+        }
+
+
+class SSEBuffer:
+    """Coalesces small SSE frames so per-token deltas don't each cost a write."""
+    
+    def __init__(self, max_bytes: int = 1024, max_delay: float = 0.02):
+        self.max_bytes = max_bytes
+        self.max_delay = max_delay
+        self._buf = bytearray()
+        self._last_flush = time.monotonic()
+    
+    def add(self, frame: bytes) -> None:
+        """Buffer a frame until it is due to be sent."""
+        self._buf += frame
+    
+    def time_until_due(self) -> Optional[float]:
+        """Seconds until the buffered bytes must go out, or None while nothing is buffered."""
+        if not self._buf:
+            return None
+        return max(0.0, self._last_flush + self.max_delay - time.monotonic())
+    
+    def poll(self) -> Optional[bytes]:
+        """Return the pending bytes once they are due to be sent; call on every delta."""
+        if self._buf and (len(self._buf) >= self.max_bytes or time.monotonic() - self._last_flush >= self.max_delay):
+            return self.flush()
+        return None
+    
+    def flush(self) -> bytes:
+        """Return and clear everything buffered so far."""
+        data = bytes(self._buf)
+        self._buf.clear()
+        self._last_flush = time.monotonic()
+        return data
+
+
+_STREAM_END = object()
+
+
+def iter_deltas_with_deadline(response, sse_buffer: SSEBuffer) -> Iterator[Dict[str, Any]]:
+    """
+    Like iter_stream_deltas, but also yields an empty delta whenever the buffer's
+    flush deadline passes while upstream is quiet, so the caller's poll() still runs.
+    """
+    deltas = Queue()
+    
+    def pump():
+        try:
+            for delta in iter_stream_deltas(response):
+                deltas.put(delta)
+        except Exception as e:
+            deltas.put(e)
+        finally:
+            deltas.put(_STREAM_END)
+    
+    # Upstream is read in its own greenlet so waiting on it can time out
+    reader = gevent.spawn(pump)
+    try:
+        while True:
+            try:
+                item = deltas.get(timeout=sse_buffer.time_until_due())
+            except Empty:
+                yield {}
+                continue
+            if item is _STREAM_END:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        reader.kill()
+
+
 @app.route('/health', methods=['GET'])
 def health():
     """Health check."""
@@ -132,7 +405,7 @@ def register():
     if users_collection.find_one({'username': username}):
         return jsonify({'message': 'Username already exists'}), 400
 
-    hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+    hashed_password = bcrypt_pool.apply(bcrypt.hashpw, (password.encode('utf-8'), bcrypt.gensalt()))
     
     user_id = users_collection.insert_one({
         'username': username,
@@ -152,13 +425,26 @@ def login():
     if not username or not password:
         return jsonify({'message': 'Username and password are required'}), 400
 
-    user = users_collection.find_one({'username': username})
-
-    if user and bcrypt.checkpw(password.encode('utf-8'), user['password']):
+    user_id = None
+    if LOGIN_CACHE_ENABLED:
+        cache_key = _login_cache_key(username, password)
+        with _login_cache_lock:
+            user_id = _login_cache.get(cache_key)
+
+    if user_id is None:
+        user = users_collection.find_one({'username': username})
+        if user and bcrypt_pool.apply(bcrypt.checkpw, (password.encode('utf-8'), user['password'])):
+            user_id = str(user['_id'])
+            if LOGIN_CACHE_ENABLED:
+                with _login_cache_lock:
+                    _login_cache[cache_key] = user_id
+
+    if user_id is not None:
+        # Always mint a fresh token so cached logins still get a full expiry
         token = jwt.encode({
-            'user_id': str(user['_id']),
+            'user_id': user_id,
             'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=24)
-        }, JWT_SECRET, algorithm="HS256")
+        }, _JWT_KEY, algorithm="HS256")
 
         return jsonify({'token': token, 'username': username})
 
@@ -174,8 +460,17 @@ def get_chat_history(current_user):
     
     if not chat_doc:
         return jsonify({"messages": []})
-        
-    return jsonify({"messages": chat_doc.get('messages', [])})
+    
+    messages = chat_doc.get('messages', [])
+    timestamps = chat_doc.get('timestamps', [])
+    # Older documents kept the timestamp inside each message and have fewer
+    # (or no) entries in `timestamps`, so align the two lists from the end.
+    offset = len(messages) - len(timestamps)
+    for i, m in enumerate(messages):
+        if i >= offset:
+            m['timestamp'] = timestamps[i - offset]
+    
+    return jsonify({"messages": messages})
 
 
 @app.route('/chat', methods=['POST'])
@@ -190,18 +485,39 @@ def chat(current_user):
     
     user_id = str(current_user['_id'])
     
-    # Load history from DB
-    chat_doc = chats_collection.find_one({'user_id': user_id})
+    # Load only the recent window of history from DB; a $slice alone would still return the timestamps
+    chat_doc = chats_collection.find_one(
+        {'user_id': user_id},
+        {'messages': {'$slice': -CHAT_HISTORY_WINDOW}, 'timestamps': 0}
+    )
     if not chat_doc:
         history = []
     else:
         history = chat_doc.get('messages', [])
+        # Older documents stored the timestamp inside each message
+        for m in history:
+            m.pop('timestamp', None)
+    
+    # The window may cut between an assistant tool call and its results;
+    # orphaned tool messages are rejected by the LLM API.
+    while history and history[0].get('role') == 'tool':
+        history.pop(0)
+
+    # Messages produced this turn; only these are appended to the stored history.
+    # Messages are stored in the exact shape the LLM expects, with their
+    # timestamps kept in a parallel `timestamps` array.
+    new_messages = []
+    new_timestamps = []
+
+    def record(message):
+        history.append(message)
+        new_messages.append(message)
+        new_timestamps.append(datetime.datetime.utcnow().isoformat())
 
     # Add user message to history
-    history.append({
+    record({
         "role": "user",
-        "content": user_message,
-        "timestamp": datetime.datetime.utcnow().isoformat()
+        "content": user_message
     })
     
     # System prompt
@@ -221,19 +537,10 @@ Be creative with positioning objects so they don't overlap. Use different locati
 Always explain what you're doing in a friendly way."""
     }
     
-    # Filter history for LLM
-    llm_history = []
-    for m in history:
-        msg = {"role": m["role"], "content": m["content"]}
-        if "tool_calls" in m:
-            msg["tool_calls"] = m["tool_calls"]
-        if "tool_call_id" in m:
-            msg["tool_call_id"] = m["tool_call_id"]
-        llm_history.append(msg)
-
-    messages = [system_message] + llm_history
+    messages = [system_message] + history
     
     def generate():
+        sse_buffer = SSEBuffer()
         try:
             # Get tools
             tools = blender_client.get_tools_for_llm()
@@ -242,163 +549,168 @@ Always explain what you're doing in a friendly way."""
             response = call_openrouter(messages, tools, stream=True)
             
             assistant_content = ""
-            tool_calls_buffer = []
-            current_tool_call = None
+            tool_calls_buffer: Dict[int, _ToolCallBuffer] = {}
             
-            for line in response.iter_lines():
-                if not line:
-                    continue
+            for delta in iter_deltas_with_deadline(response, sse_buffer):
+                # Handle content
+                if 'content' in delta and delta['content']:
+                    content_chunk = delta['content']
+                    assistant_content += content_chunk
+                    sse_buffer.add(sse_event({'content': content_chunk}))
                 
-                line_text = line.decode('utf-8')
-                if line_text.startswith("data: "):
-                    data_str = line_text[6:]
-                    if data_str == "[DONE]":
-                        break
-                    
-                    try:
-                        chunk = json.loads(data_str)
-                        delta = chunk['choices'][0]['delta']
+                # Handle tool calls
+                if delta.get('tool_calls'):
+                    for tc_chunk in delta['tool_calls']:
+                        get = tc_chunk.get
+                        # Keyed by index so non-contiguous indices don't need padding
+                        index = get('index', 0)
+                        tc = tool_calls_buffer.get(index)
+                        if tc is None:
+                            tc = tool_calls_buffer[index] = _ToolCallBuffer()
                         
-                        # Handle content
-                        if 'content' in delta and delta['content']:
-                            content_chunk = delta['content']
-                            assistant_content += content_chunk
-                            yield f"data: {json.dumps({'content': content_chunk})}\n\n"
+                        # Providers may send explicit nulls for fields they don't update
+                        tc.id += get('id') or ''
                         
-                        # Handle tool calls
-                        if 'tool_calls' in delta:
-                            for tc_chunk in delta['tool_calls']:
-                                index = tc_chunk['index']
-                                
-                                # Extend buffer if needed
-                                while len(tool_calls_buffer) <= index:
-                                    tool_calls_buffer.append({"id": "", "function": {"name": "", "arguments": ""}, "type": "function"})
-                                
-                                tc = tool_calls_buffer[index]
-                                
-                                if 'id' in tc_chunk and tc_chunk['id']:
-                                    tc['id'] += tc_chunk['id']
-                                
-                                if 'function' in tc_chunk:
-                                    fn = tc_chunk['function']
-                                    if 'name' in fn and fn['name']:
-                                        tc['function']['name'] += fn['name']
-                                    if 'arguments' in fn and fn['arguments']:
-                                        tc['function']['arguments'] += fn['arguments']
-
-                    except json.JSONDecodeError:
-                        continue
+                        fn = get('function')
+                        if fn:
+                            tc.name += fn.get('name') or ''
+                            tc.arguments += fn.get('arguments') or ''
+                
+                # Checked on every delta (and deadline tick), so buffered content isn't held back
+                frame = sse_buffer.poll()
+                if frame:
+                    yield frame
             
             # If we have tool calls, execute them
             if tool_calls_buffer:
-                # Clean up buffer (remove empty entries if any, though logic above should be safe)
-                tool_calls = [tc for tc in tool_calls_buffer if tc['function']['name']]
+                # Order by index and drop entries that never received a name
+                tool_calls = [
+                    tool_calls_buffer[i].to_dict() for i in sorted(tool_calls_buffer)
+                    if tool_calls_buffer[i].name
+                ]
                 
-                # Notify frontend about tool execution start
-                yield f"data: {json.dumps({'status': 'executing_tools', 'count': len(tool_calls)})}\n\n"
+                # Notify frontend about tool execution start (tool events bypass the buffer)
+                pending = sse_buffer.flush()
+                if pending:
+                    yield pending
+                yield sse_event({'status': 'executing_tools', 'count': len(tool_calls)})
                 
-                tool_results = []
+                calls = []
                 for tool_call in tool_calls:
                     function_name = tool_call['function']['name']
                     try:
                         function_args = json.loads(tool_call['function']['arguments'])
                     except:
                         function_args = {}
-                    
+                    # The model can send e.g. null or a list; everything downstream expects a dict
+                    if not isinstance(function_args, dict):
+                        function_args = {}
+                    calls.append((function_name, function_args))
+                
+                def execute(call):
+                    function_name, function_args = call
                     logger.info(f"Executing tool: {function_name} with args: {function_args}")
                     
                     # Call Orchestrator
-                    result = blender_client.call_tool(function_name, function_args, user_id=user_id)
+                    return blender_client.call_tool(function_name, function_args, user_id=user_id)
+                
+                if len(calls) > 1 and all(name in PRIMITIVE_TOOLS for name, _ in calls):
+                    # Only object creations: send them to Blender as a single batch
+                    logger.info(f"Executing {len(calls)} primitive creations as one batch")
+                    results = blender_client.add_primitives(calls, user_id=user_id)
+                elif tool_calls_are_independent(calls):
+                    # One round trip; the orchestrator fans the calls out to the instance
+                    logger.info(f"Executing {len(calls)} independent tool calls as one batch")
+                    results = blender_client.call_tools(calls, user_id=user_id)
+                else:
+                    results = map(execute, calls)
+                
+                tool_results = []
+                for (function_name, _), result in zip(calls, results):
                     tool_results.append({
                         "tool": function_name,
                         "result": result
                     })
                     
                     # Stream tool result to frontend
-                    yield f"data: {json.dumps({'tool_call': {'tool': function_name, 'result': result}})}\n\n"
+                    yield sse_event({'tool_call': {'tool': function_name, 'result': result.data}})
 
                 # Append to history
-                history.append({
+                record({
                     "role": "assistant",
                     "content": assistant_content or None,
-                    "tool_calls": tool_calls,
-                    "timestamp": datetime.datetime.utcnow().isoformat()
+                    "tool_calls": tool_calls
                 })
                 
                 for i, tool_call in enumerate(tool_calls):
-                    history.append({
+                    record({
                         "role": "tool",
                         "tool_call_id": tool_call['id'],
-                        "content": json.dumps(tool_results[i]['result']),
-                        "timestamp": datetime.datetime.utcnow().isoformat()
+                        # Already JSON text from the orchestrator; no need to re-encode
+                        "content": tool_results[i]['result'].raw
                     })
                 
                 # Call LLM again with tool results
-                # Re-construct messages
-                llm_history = []
-                for m in history:
-                    msg = {"role": m["role"], "content": m["content"]}
-                    if "tool_calls" in m:
-                        msg["tool_calls"] = m["tool_calls"]
-                    if "tool_call_id" in m:
-                        msg["tool_call_id"] = m["tool_call_id"]
-                    llm_history.append(msg)
+                messages_with_tools = [system_message] + history
                 
-                messages_with_tools = [system_message] + llm_history
-                
-                logger.info(f"Sending second request to OpenRouter with messages: {json.dumps(messages_with_tools)}")
+                logger.debug("Sending second request to OpenRouter with %d messages", len(messages_with_tools))
                 
                 # Second call to LLM
                 response_final = call_openrouter(messages_with_tools, stream=True)
                 
                 final_content = ""
-                for line in response_final.iter_lines():
-                    if not line:
-                        continue
-                    line_text = line.decode('utf-8')
-                    if line_text.startswith("data: "):
-                        data_str = line_text[6:]
-                        if data_str == "[DONE]":
-                            break
-                        try:
-                            chunk = json.loads(data_str)
-                            delta = chunk['choices'][0]['delta']
-                            if 'content' in delta and delta['content']:
-                                content_chunk = delta['content']
-                                final_content += content_chunk
-                                yield f"data: {json.dumps({'content': content_chunk})}\n\n"
-                        except:
-                            pass
+                for delta in iter_deltas_with_deadline(response_final, sse_buffer):
+                    if 'content' in delta and delta['content']:
+                        content_chunk = delta['content']
+                        final_content += content_chunk
+                        sse_buffer.add(sse_event({'content': content_chunk}))
+                    frame = sse_buffer.poll()
+                    if frame:
+                        yield frame
                 
                 # Save final assistant message
-                history.append({
+                record({
                     "role": "assistant",
-                    "content": final_content,
-                    "timestamp": datetime.datetime.utcnow().isoformat()
+                    "content": final_content
                 })
                 
             else:
                 # No tool calls, just save the assistant content
-                history.append({
+                record({
                     "role": "assistant",
-                    "content": assistant_content,
-                    "timestamp": datetime.datetime.utcnow().isoformat()
+                    "content": assistant_content
                 })
             
+            # Send what's left before the DB write rather than after it
+            pending = sse_buffer.flush()
+            if pending:
+                yield pending
+            
             # Save to DB
             chats_collection.update_one(
                 {'user_id': user_id},
-                {'$set': {'messages': history, 'updated_at': datetime.datetime.utcnow()}},
+                {
+                    '$push': {
+                        'messages': {'$each': new_messages},
+                        'timestamps': {'$each': new_timestamps}
+                    },
+                    '$set': {'updated_at': datetime.datetime.utcnow()}
+                },
                 upsert=True
             )
             
-            yield "data: [DONE]\n\n"
+            yield b"data: [DONE]\n\n"
             
         except Exception as e:
             logger.error(f"Streaming error: {e}", exc_info=True)
-            yield f"data: {json.dumps({'error': str(e)})}\n\n"
+            yield sse_buffer.flush() + sse_event({'error': str(e)})
 
-    return Response(stream_with_context(generate()), mimetype='text/event-stream')
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        # Keep reverse proxies (nginx) from buffering the stream
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 
 @app.route('/instance', methods=['GET'])
@@ -407,7 +719,7 @@ def get_instance_info(current_user):
     """Get info about the user's Blender instance."""
     user_id = str(current_user['_id'])
     try:
-        response = requests.get(f"{ORCHESTRATOR_URL}/instance/{user_id}", timeout=5)
+        response = blender_client.session.get(f"{ORCHESTRATOR_URL}/instance/{user_id}", timeout=5)
         if response.status_code == 200:
             return jsonify(response.json())
         return jsonify({"status": "unknown", "error": "Failed to fetch from orchestrator"}), response.status_code
@@ -2,18 +2,45 @@
 Blender MCP Client for communicating with Blender MCP server via Orchestrator.
 """
 import requests
-import json
+import orjson
+from dataclasses import dataclass
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import logging
 from typing import List, Dict, Any
 
 logger = logging.getLogger(__name__)
 
 
+@dataclass
+class ToolResult:
+    """Outcome of a tool call, parsed for the UI and as raw JSON text for the LLM."""
+    data: Dict[str, Any]
+    raw: str
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ToolResult":
+        return cls(data=data, raw=orjson.dumps(data).decode())
+
+
+# Tools that only create an object; calls to these can be merged into one add_primitives call
+PRIMITIVE_TOOLS = {"add_cube": "cube", "add_sphere": "sphere", "add_cylinder": "cylinder"}
+
+
 class BlenderMCPClient:
     """Client for communicating with Blender MCP server via Orchestrator."""
     
     def __init__(self, orchestrator_url: str):
         self.orchestrator_url = orchestrator_url
+        # Shared keep-alive session for all orchestrator calls
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=10,
+            pool_maxsize=50,
+            max_retries=Retry(total=2, backoff_factor=0.3)
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
         self.tools = []
         # Tools are static for now, or we could fetch from a default instance
         # For simplicity, we'll hardcode or fetch from orchestrator if it supported it.
@@ -35,11 +62,23 @@ class BlenderMCPClient:
             {"name": "list_objects", "description": "List objects", "inputSchema": {"type": "object", "properties": {}}},
             {"name": "clear_scene", "description": "Clear scene", "inputSchema": {"type": "object", "properties": {}}}
         ]
+        # The tool list is static, so the OpenRouter function-calling payload is built once
+        self._tools_for_llm = [
+            {
+                "type": "function",
+                "function": {
+                    "name": tool["name"],
+                    "description": tool["description"],
+                    "parameters": tool["inputSchema"]
+                }
+            }
+            for tool in self.tools
+        ]
     
-    def call_tool(self, tool_name: str, arguments: Dict[str, Any], user_id: str) -> Dict[str, Any]:
+    def call_tool(self, tool_name: str, arguments: Dict[str, Any], user_id: str) -> ToolResult:
         """Call a tool via Orchestrator."""
         try:
-            response = requests.post(
+            response = self.session.post(
                 f"{self.orchestrator_url}/execute",
                 json={
                     "user_id": user_id,
@@ -49,28 +88,75 @@ class BlenderMCPClient:
                 timeout=60
             )
             response.raise_for_status()
-            result = response.json()
-            
-            # Extract text content if wrapped
-            if 'content' in result and len(result['content']) > 0:
-                text_content = result['content'][0].get('text', '{}')
-                return json.loads(text_content)
-            
-            return result
+            return self._to_tool_result(orjson.loads(response.content))
         except Exception as e:
             logger.error(f"Tool call failed: {e}")
-            return {"status": "error", "message": str(e)}
+            return ToolResult.from_dict({"status": "error", "message": str(e)})
+
+    def call_tools(self, calls: List[tuple], user_id: str) -> List[ToolResult]:
+        """Run independent (tool_name, arguments) calls concurrently via the Orchestrator."""
+        try:
+            response = self.session.post(
+                f"{self.orchestrator_url}/execute_batch",
+                json={
+                    "user_id": user_id,
+                    "calls": [{"tool_name": tool_name, "arguments": arguments} for tool_name, arguments in calls]
+                },
+                # Blender runs the calls one at a time, so allow each its own 60s
+                timeout=60 * len(calls)
+            )
+            response.raise_for_status()
+            results = orjson.loads(response.content)["results"]
+        except Exception as e:
+            logger.error(f"Batched tool call failed: {e}")
+            error = ToolResult.from_dict({"status": "error", "message": str(e)})
+            return [error] * len(calls)
+        
+        tool_results = []
+        for (tool_name, _), result in zip(calls, results):
+            try:
+                tool_results.append(self._to_tool_result(result))
+            except Exception as e:
+                logger.error(f"Tool {tool_name} returned an unreadable result: {e}")
+                tool_results.append(ToolResult.from_dict({"status": "error", "message": str(e)}))
+        return tool_results
+
+    @staticmethod
+    def _to_tool_result(result: Dict[str, Any]) -> ToolResult:
+        # Extract text content if wrapped, keeping the JSON text as received
+        if 'content' in result and len(result['content']) > 0:
+            text_content = result['content'][0].get('text', '{}')
+            return ToolResult(data=orjson.loads(text_content), raw=text_content)
+        
+        return ToolResult.from_dict(result)
+
+    def add_primitives(self, calls: List[tuple], user_id: str) -> List[ToolResult]:
+        """Run several (tool_name, arguments) primitive creations as one add_primitives call."""
+        specs = [dict(arguments, type=PRIMITIVE_TOOLS[tool_name]) for tool_name, arguments in calls]
+        batch = self.call_tool("add_primitives", {"specs": specs}, user_id=user_id)
+        
+        results = batch.data.get("results")
+        if isinstance(results, list) and len(results) == len(calls):
+            return [ToolResult.from_dict(result) for result in results]
+        
+        if self._is_unknown_tool(batch.data):
+            # An older Blender image without add_primitives: nothing was created yet
+            logger.warning(f"add_primitives unavailable, falling back to single calls: {batch.data}")
+            return [self.call_tool(tool_name, arguments, user_id=user_id) for tool_name, arguments in calls]
+        
+        # Any other failure (timeout, 5xx, reset) may have created some objects already,
+        # so retrying one by one could duplicate them
+        logger.error(f"add_primitives failed: {batch.data}")
+        if batch.data.get("status") != "error":
+            batch = ToolResult.from_dict({"status": "error", "message": f"Unexpected add_primitives result: {batch.raw}"})
+        return [batch] * len(calls)
+
+    @staticmethod
+    def _is_unknown_tool(data: Dict[str, Any]) -> bool:
+        """Whether an error result says the instance doesn't have the tool at all."""
+        message = str(data.get("message", ""))
+        return data.get("status") == "error" and ("Unknown tool" in message or message.startswith("404 "))
 
     def get_tools_for_llm(self) -> List[Dict[str, Any]]:
         """Format tools for OpenRouter function calling."""
-        formatted_tools = []
-        for tool in self.tools:
-            formatted_tools.append({
-                "type": "function",
-                "function": {
-                    "name": tool["name"],
-                    "description": tool["description"],
-                    "parameters": tool["inputSchema"]
-                }
-            })
-        return formatted_tools
+        return self._tools_for_llm
@@ -3,49 +3,78 @@ Blender operations wrapper for MCP server.
 Provides high-level functions that wrap Blender's bpy API.
 """
 import bpy
+import bmesh
 import os
-from typing import Dict, Any, Optional, Tuple
+from typing import Dict, Any, List, Optional, Sequence
+
+
+def _remove_all_objects():
+    """Delete every object, and any mesh data left without users."""
+    for obj in list(bpy.data.objects):
+        bpy.data.objects.remove(obj, do_unlink=True)
+    for mesh in list(bpy.data.meshes):
+        if mesh.users == 0:
+            bpy.data.meshes.remove(mesh)
+
+
+def _link_mesh_object(name: str, bm, location) -> Any:
+    """Turn a bmesh into a new object linked to the active collection."""
+    mesh = bpy.data.meshes.new(name)
+    bm.to_mesh(mesh)
+    bm.free()
+    
+    obj = bpy.data.objects.new(name, mesh)
+    obj.location = location
+    bpy.context.collection.objects.link(obj)
+    return obj
 
 
 def initialize_scene():
     """Initialize a clean Blender scene."""
+    # Objects are built through bpy.data rather than bpy.ops, which avoids
+    # operator overhead (undo pushes, per-call depsgraph updates, context state).
+    
     # Clear existing objects
-    bpy.ops.object.select_all(action='SELECT')
-    bpy.ops.object.delete()
+    _remove_all_objects()
+    
+    collection = bpy.context.collection
     
     # Add camera
-    bpy.ops.object.camera_add(location=(7, -7, 5))
-    camera = bpy.context.view_layer.objects.active
+    camera = bpy.data.objects.new("Camera", bpy.data.cameras.new("Camera"))
+    camera.location = (7, -7, 5)
     camera.rotation_euler = (1.1, 0, 0.785)
+    collection.objects.link(camera)
     bpy.context.scene.camera = camera
     
     # Add light
-    bpy.ops.object.light_add(type='SUN', location=(5, 5, 10))
-    light = bpy.context.view_layer.objects.active
-    light.data.energy = 2.0
+    light_data = bpy.data.lights.new("Light", type='SUN')
+    light_data.energy = 2.0
+    light = bpy.data.objects.new("Light", light_data)
+    light.location = (5, 5, 10)
+    collection.objects.link(light)
+    
+    bpy.context.view_layer.update()
     
     return {"status": "success", "message": "Scene initialized"}
 
 
-def add_cube(location: Tuple[float, float, float] = (0, 0, 0), 
+def add_cube(location: Sequence[float] = (0, 0, 0), 
              size: float = 2.0,
              name: Optional[str] = None) -> Dict[str, Any]:
     """
     Add a cube to the scene.
     
     Args:
-        location: (x, y, z) position
+        location: (x, y, z) position, as any sequence of floats
         size: Size of the cube
         name: Optional name for the object
     
     Returns:
         Dict with status and object info
     """
-    bpy.ops.mesh.primitive_cube_add(size=size, location=location)
-    obj = bpy.context.view_layer.objects.active
-    
-    if name:
-        obj.name = name
+    bm = bmesh.new()
+    bmesh.ops.create_cube(bm, size=size)
+    obj = _link_mesh_object(name or "Cube", bm, location)
     
     return {
         "status": "success",
@@ -55,25 +84,23 @@ def add_cube(location: Tuple[float, float, float] = (0, 0, 0),
     }
 
 
-def add_sphere(location: Tuple[float, float, float] = (0, 0, 0),
+def add_sphere(location: Sequence[float] = (0, 0, 0),
                radius: float = 1.0,
                name: Optional[str] = None) -> Dict[str, Any]:
     """
     Add a UV sphere to the scene.
     
     Args:
-        location: (x, y, z) position
+        location: (x, y, z) position, as any sequence of floats
         radius: Radius of the sphere
         name: Optional name for the object
     
     Returns:
         Dict with status and object info
     """
-    bpy.ops.mesh.primitive_uv_sphere_add(radius=radius, location=location)
-    obj = bpy.context.view_layer.objects.active
-    
-    if name:
-        obj.name = name
+    bm = bmesh.new()
+    bmesh.ops.create_uvsphere(bm, u_segments=32, v_segments=16, radius=radius)
+    obj = _link_mesh_object(name or "Sphere", bm, location)
     
     return {
         "status": "success",
@@ -83,7 +110,7 @@ def add_sphere(location: Tuple[float, float, float] = (0, 0, 0),
     }
 
 
-def add_cylinder(location: Tuple[float, float, float] = (0, 0, 0),
+def add_cylinder(location: Sequence[float] = (0, 0, 0),
                  radius: float = 1.0,
                  depth: float = 2.0,
                  name: Optional[str] = None) -> Dict[str, Any]:
@@ -91,7 +118,7 @@ def add_cylinder(location: Tuple[float, float, float] = (0, 0, 0),
     Add a cylinder to the scene.
     
     Args:
-        location: (x, y, z) position
+        location: (x, y, z) position, as any sequence of floats
         radius: Radius of the cylinder
         depth: Height of the cylinder
         name: Optional name for the object
@@ -99,11 +126,10 @@ def add_cylinder(location: Tuple[float, float, float] = (0, 0, 0),
     Returns:
         Dict with status and object info
     """
-    bpy.ops.mesh.primitive_cylinder_add(radius=radius, depth=depth, location=location)
-    obj = bpy.context.view_layer.objects.active
-    
-    if name:
-        obj.name = name
+    bm = bmesh.new()
+    bmesh.ops.create_cone(bm, cap_ends=True, segments=32,
+                          radius1=radius, radius2=radius, depth=depth)
+    obj = _link_mesh_object(name or "Cylinder", bm, location)
     
     return {
         "status": "success",
@@ -114,14 +140,49 @@ def add_cylinder(location: Tuple[float, float, float] = (0, 0, 0),
     }
 
 
+def add_primitives(specs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Add several primitives to the scene in one pass.
+    
+    Args:
+        specs: List of dicts, each with a 'type' ('cube', 'sphere' or
+               'cylinder') plus the arguments of the matching add_* function
+    
+    Returns:
+        Dict with status and one result per spec, in order
+    """
+    builders = {"cube": add_cube, "sphere": add_sphere, "cylinder": add_cylinder}
+    
+    results = []
+    for spec in specs:
+        params = dict(spec)
+        builder = builders.get(params.pop("type", None))
+        if not builder:
+            results.append({"status": "error", "message": f"Unknown primitive type in {spec}"})
+            continue
+        try:
+            results.append(builder(**params))
+        except Exception as e:
+            results.append({"status": "error", "message": str(e)})
+    
+    # One depsgraph update for the whole batch
+    bpy.context.view_layer.update()
+    
+    return {
+        "status": "success",
+        "results": results,
+        "count": len(results)
+    }
+
+
 def set_object_color(object_name: str, 
-                     color: Tuple[float, float, float, float] = (1.0, 0.0, 0.0, 1.0)) -> Dict[str, Any]:
+                     color: Sequence[float] = (1.0, 0.0, 0.0, 1.0)) -> Dict[str, Any]:
     """
     Set the color of an object.
     
     Args:
         object_name: Name of the object
-        color: RGBA color tuple (values 0-1)
+        color: RGBA color sequence (values 0-1)
     
     Returns:
         Dict with status
@@ -238,8 +299,7 @@ def clear_scene() -> Dict[str, Any]:
     Returns:
         Dict with status
     """
-    bpy.ops.object.select_all(action='SELECT')
-    bpy.ops.object.delete()
+    _remove_all_objects()
     
     return {
         "status": "success",
@@ -8,9 +8,14 @@ import os
 # Add the script directory to Python path so we can import blender_operations
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from fastmcp import FastMCP, Image
+from fastmcp import Client, FastMCP, Image
+from starlette.middleware import Middleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse
+import anyio
 import base64
-from typing import Optional, List
+import tempfile
+from typing import Optional, List, Dict, Any, Sequence
 import logging
 
 # Import blender operations
@@ -23,6 +28,81 @@ logger = logging.getLogger(__name__)
 # Create the MCP server
 mcp = FastMCP("BlenderMCP")
 
+# Set by the orchestrator on per-user pods; tool calls for anyone else are refused
+BLENDER_USER_ID = os.getenv("BLENDER_USER_ID")
+USER_HEADER = b"x-blender-user"
+
+
+class BlenderUserGuard:
+    """
+    ASGI middleware tying this instance to its user.
+    
+    Pod IPs are reused, so a stale orchestrator cache entry could point at another
+    user's pod. Requests must name this pod's user in X-Blender-User, and every
+    response names it back so the orchestrator can check who answered.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        # Kubelet probes don't carry the header
+        if scope["type"] != "http" or not BLENDER_USER_ID or scope["path"] == "/health":
+            await self.app(scope, receive, send)
+            return
+        
+        owner = BLENDER_USER_ID.encode()
+        requested = dict(scope["headers"]).get(USER_HEADER)
+        if requested != owner:
+            await send({
+                "type": "http.response.start",
+                "status": 409,
+                "headers": [(b"content-type", b"text/plain"), (USER_HEADER, owner)]
+            })
+            await send({"type": "http.response.body", "body": b"Instance belongs to another user"})
+            return
+        
+        async def send_with_owner(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(USER_HEADER, owner)]
+            await send(message)
+        
+        await self.app(scope, receive, send_with_owner)
+
+
+@mcp.custom_route("/health", methods=["GET"])
+async def health(request: Request) -> PlainTextResponse:
+    """Target of the pod's readinessProbe; streamable HTTP itself only serves /mcp"""
+    return PlainTextResponse("OK")
+
+
+@mcp.custom_route("/tools/call", methods=["POST"])
+async def http_call_tool(request: Request) -> JSONResponse:
+    """
+    Orchestrator contract: POST {"name", "arguments"} runs one registered tool
+    
+    Answers with the MCP CallToolResult as JSON ({"content": [...], "isError": ...}),
+    or 404 if no tool has that name.
+    """
+    try:
+        body = await request.json()
+        name, arguments = body.get("name"), body.get("arguments") or {}
+    except (ValueError, AttributeError):
+        return JSONResponse({"status": "error", "message": "Expected a JSON object"}, status_code=400)
+    
+    if name not in await mcp.get_tools():
+        return JSONResponse({"status": "error", "message": f"Unknown tool: {name}"}, status_code=404)
+    
+    # In-memory client: same validation and tool path as an MCP call on /mcp,
+    # run on this event loop, i.e. Blender's main thread
+    async with Client(mcp) as client:
+        result = await client.call_tool_mcp(name, arguments)
+    return JSONResponse(result.model_dump(mode="json", exclude_none=True))
+
+
+# bpy may only be used from Blender's main thread, which is the thread the
+# event loop runs on. Tools are therefore synchronous and call bpy directly;
+# only file I/O is done asynchronously.
 
 @mcp.tool()
 def initialize_scene() -> str:
@@ -33,7 +113,7 @@ def initialize_scene() -> str:
 
 @mcp.tool()
 def add_cube(
-    location: List[float] = [0, 0, 0],
+    location: Sequence[float] = (0, 0, 0),
     size: float = 2.0,
     name: Optional[str] = None
 ) -> str:
@@ -46,7 +126,7 @@ def add_cube(
         name: Optional name for the object
     """
     result = bops.add_cube(
-        location=tuple(location),
+        location=location,
         size=size,
         name=name
     )
@@ -55,7 +135,7 @@ def add_cube(
 
 @mcp.tool()
 def add_sphere(
-    location: List[float] = [0, 0, 0],
+    location: Sequence[float] = (0, 0, 0),
     radius: float = 1.0,
     name: Optional[str] = None
 ) -> str:
@@ -68,7 +148,7 @@ def add_sphere(
         name: Optional name for the object
     """
     result = bops.add_sphere(
-        location=tuple(location),
+        location=location,
         radius=radius,
         name=name
     )
@@ -77,7 +157,7 @@ def add_sphere(
 
 @mcp.tool()
 def add_cylinder(
-    location: List[float] = [0, 0, 0],
+    location: Sequence[float] = (0, 0, 0),
     radius: float = 1.0,
     depth: float = 2.0,
     name: Optional[str] = None
@@ -92,7 +172,7 @@ def add_cylinder(
         name: Optional name for the object
     """
     result = bops.add_cylinder(
-        location=tuple(location),
+        location=location,
         radius=radius,
         depth=depth,
         name=name
@@ -100,10 +180,24 @@ def add_cylinder(
     return f"Added cylinder '{result['object_name']}' at {result['location']} with radius {result['radius']} and depth {result['depth']}"
 
 
+@mcp.tool()
+def add_primitives(specs: List[Dict[str, Any]]) -> dict:
+    """
+    Add several cubes, spheres and cylinders to the 3D scene in one call
+    
+    Args:
+        specs: Objects to add, each with a 'type' ('cube', 'sphere' or 'cylinder')
+               plus the arguments of add_cube, add_sphere or add_cylinder
+    """
+    result = bops.add_primitives(specs)
+    logger.info(f"Added {result['count']} primitives")
+    return result
+
+
 @mcp.tool()
 def set_object_color(
     object_name: str,
-    color: List[float] = [1.0, 0.0, 0.0, 1.0]
+    color: Sequence[float] = (1.0, 0.0, 0.0, 1.0)
 ) -> str:
     """
     Set the color of an object in the scene
@@ -114,7 +208,7 @@ def set_object_color(
     """
     result = bops.set_object_color(
         object_name=object_name,
-        color=tuple(color)
+        color=color
     )
     
     if result['status'] == 'error':
@@ -124,7 +218,7 @@ def set_object_color(
 
 
 @mcp.tool()
-def render_scene(
+async def render_scene(
     resolution_x: int = 1920,
     resolution_y: int = 1080,
     samples: int = 64
@@ -137,23 +231,29 @@ def render_scene(
         resolution_y: Height in pixels
         samples: Render quality (higher = better, slower)
     """
-    output_path = "/tmp/render.png"
-    result = bops.render_scene(
-        output_path=output_path,
-        resolution_x=resolution_x,
-        resolution_y=resolution_y,
-        samples=samples
-    )
-    
-    # Read the rendered image
-    if os.path.exists(output_path):
-        with open(output_path, 'rb') as f:
-            image_data = f.read()
+    # Per-request output file so concurrent renders can't overwrite each other
+    fd, output_path = tempfile.mkstemp(prefix="render-", suffix=".png")
+    os.close(fd)
+    image_path = anyio.Path(output_path)
+    try:
+        result = bops.render_scene(
+            output_path=output_path,
+            resolution_x=resolution_x,
+            resolution_y=resolution_y,
+            samples=samples
+        )
         
-        logger.info(f"Rendered scene at {resolution_x}x{resolution_y} with {samples} samples")
-        return Image(data=image_data, format="png")
-    else:
+        # Read the rendered image without blocking the event loop. MCP sends
+        # images inline as base64, so the bytes are needed in memory once anyway.
+        image_data = await image_path.read_bytes()
+    finally:
+        await image_path.unlink(missing_ok=True)
+    
+    if not image_data:
         raise Exception("Render failed: output file not created")
+    
+    logger.info(f"Rendered scene at {resolution_x}x{resolution_y} with {samples} samples")
+    return Image(data=image_data, format="png")
 
 
 @mcp.tool()
@@ -181,8 +281,18 @@ def clear_scene() -> str:
 def main():
     """Run the MCP server"""
     logger.info("Starting Blender MCP Server with FastMCP...")
-    logger.info(f"Available tools: initialize_scene, add_cube, add_sphere, add_cylinder, set_object_color, render_scene, list_objects, clear_scene")
-    mcp.run()
+    logger.info(f"Available tools: initialize_scene, add_cube, add_sphere, add_cylinder, add_primitives, set_object_color, render_scene, list_objects, clear_scene")
+    port = os.getenv("PORT")
+    if port:
+        # Per-user pods: the orchestrator calls /tools/call, MCP clients can use /mcp
+        mcp.run(
+            transport="streamable-http",
+            host="0.0.0.0",
+            port=int(port),
+            middleware=[Middleware(BlenderUserGuard)]
+        )
+    else:
+        mcp.run()
 
 
 if __name__ == '__main__':
@@ -1,22 +1,45 @@
 import logging
 import os
-from flask import Flask, request, jsonify, Response
+import orjson
+from flask import Flask, request, jsonify, Response, stream_with_context
+from flask.json.provider import JSONProvider
 from k8s_provider import K8sProvider
-from orchestrator_service import OrchestratorService
+from orchestrator_service import OrchestratorService, SpawnQueueFull, create_http_session
 
+# Logging is configured here only; the other orchestrator modules just get their loggers
 logging.basicConfig(level=logging.INFO)
+# Per-connection and per-apiserver-call chatter from the HTTP clients
+logging.getLogger('urllib3').setLevel(logging.WARNING)
+logging.getLogger('kubernetes.client.rest').setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
 
+
+class OrjsonProvider(JSONProvider):
+    """Flask JSON provider backed by orjson, used by jsonify and request.get_json."""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 
 # Initialize Provider and Orchestrator
 orchestrator = None
 try:
+    # One pooled session for every call to Blender pods, sized for concurrent proxying
+    http_session = create_http_session(
+        pool_connections=int(os.getenv('UPSTREAM_POOL_CONNECTIONS', '20')),
+        pool_maxsize=int(os.getenv('UPSTREAM_POOL_MAXSIZE', '100'))
+    )
     provider = K8sProvider()
-    orchestrator = OrchestratorService(provider)
+    orchestrator = OrchestratorService(provider, session=http_session)
     logger.info("Orchestrator initialized successfully")
 except Exception as e:
-    logger.error(f"Failed to initialize Orchestrator: {e}")
+    logger.error("Failed to initialize Orchestrator: %s", e)
     logger.error("Orchestrator will not be available. Ensure Kubernetes is configured properly.")
 
 
@@ -32,15 +55,24 @@ def get_instance(user_id):
         info = orchestrator.get_instance_info(user_id)
         return jsonify(info)
     except Exception as e:
-        logger.error(f"Error getting instance info: {e}")
+        logger.error("Error getting instance info: %s", e)
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/instances', methods=['GET'])
+def list_instances():
+    if not orchestrator:
+        return jsonify({"error": "Orchestrator not initialized"}), 503
+    try:
+        return jsonify(orchestrator.list_instances())
+    except Exception as e:
+        logger.error("Error listing instances: %s", e)
         return jsonify({"error": str(e)}), 500
 
 @app.route('/execute', methods=['POST'])
 def execute_tool():
-    data = request.json
-    user_id = data.get('user_id')
-    tool_name = data.get('tool_name')
-    arguments = data.get('arguments')
+    # Parse the body once; a missing or malformed body falls through to the 400 below
+    data = request.get_json(cache=False, silent=True) or {}
+    user_id, tool_name, arguments = data.get('user_id'), data.get('tool_name'), data.get('arguments')
     
     if not user_id or not tool_name:
         return jsonify({"error": "Missing user_id or tool_name"}), 400
@@ -51,14 +83,48 @@ def execute_tool():
     try:
         response = orchestrator.execute_tool(user_id, tool_name, arguments)
         
+        def stream_body():
+            # Relay the upstream body chunk by chunk, releasing the connection when done
+            try:
+                for chunk in response.iter_content(chunk_size=65536):
+                    yield chunk
+            finally:
+                response.close()
+        
         return Response(
-            response.content,
+            stream_with_context(stream_body()),
             status=response.status_code,
             content_type=response.headers.get('Content-Type')
         )
         
+    except SpawnQueueFull as e:
+        logger.warning("Rejecting tool call for user %s: %s", user_id, e)
+        return jsonify({"error": "Too many instances starting, retry shortly"}), 503, {"Retry-After": "5"}
+    except Exception as e:
+        logger.error("Orchestration error: %s", e)
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/execute_batch', methods=['POST'])
+def execute_tools_batch():
+    data = request.get_json(cache=False, silent=True) or {}
+    user_id, calls = data.get('user_id'), data.get('calls')
+    
+    if not user_id or not isinstance(calls, list) or not calls:
+        return jsonify({"error": "Missing user_id or calls"}), 400
+    if not all(isinstance(call, dict) and call.get('tool_name') for call in calls):
+        return jsonify({"error": "Every call needs a tool_name"}), 400
+        
+    if not orchestrator:
+        return jsonify({"error": "Orchestrator not initialized"}), 503
+        
+    try:
+        results = orchestrator.execute_tools_batch(user_id, calls)
+        return jsonify({"results": results})
+    except SpawnQueueFull as e:
+        logger.warning("Rejecting tool batch for user %s: %s", user_id, e)
+        return jsonify({"error": "Too many instances starting, retry shortly"}), 503, {"Retry-After": "5"}
     except Exception as e:
-        logger.error(f"Orchestration error: {e}")
+        logger.error("Batch orchestration error: %s", e)
         return jsonify({"error": str(e)}), 500
 
 @app.route('/instance/<user_id>', methods=['DELETE'])
@@ -72,8 +138,9 @@ def despawn_instance(user_id):
         else:
             return jsonify({"message": f"Instance for user {user_id} not found"}), 404
     except Exception as e:
-        logger.error(f"Error despawning instance: {e}")
+        logger.error("Error despawning instance: %s", e)
         return jsonify({"error": str(e)}), 500
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5001)
+    # Each in-flight /execute holds its thread while the pod works, so serve requests concurrently
+    app.run(host='0.0.0.0', port=5001, threaded=True)
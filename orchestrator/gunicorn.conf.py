@@ -0,0 +1,18 @@
+"""
+Gunicorn settings for the orchestrator.
+
+Each /execute holds a thread while the Blender pod works, so requests are
+served by threaded workers. The app is not preloaded: every worker imports
+app.py after the fork and so builds its own HTTP session and Kubernetes
+ApiClient instead of sharing sockets with its siblings.
+"""
+import os
+
+bind = "0.0.0.0:5001"
+worker_class = "gthread"
+workers = int(os.getenv("GUNICORN_WORKERS", "4"))
+threads = int(os.getenv("GUNICORN_THREADS", "16"))
+keepalive = 65
+# A cold spawn plus a 60s tool call must not get the worker killed
+timeout = 120
+preload_app = False
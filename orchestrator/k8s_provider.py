@@ -1,16 +1,48 @@
 import logging
 import os
 import time
-import requests
-from kubernetes import client, config
+from concurrent.futures import ThreadPoolExecutor
+from kubernetes import client, config, watch
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# How long a resolved instance URL is trusted before asking the apiserver again
+URL_CACHE_TTL = 30  # seconds
+
+# Port the Blender MCP server listens on inside each pod
+BLENDER_PORT = 8080
+# Path the kubelet probes to decide when a Blender pod can take tool calls
+HEALTH_PATH = "/health"
+# Single headless Service fronting every Blender pod (instead of one NodePort Service per user)
+SHARED_SERVICE_NAME = "blender-mcp"
+
 class K8sProvider:
     def __init__(self):
+        # user_id -> (url, expires_at)
+        self._url_cache = {}
+        # Lets independent apiserver calls overlap instead of running back to back
+        self._executor = ThreadPoolExecutor(max_workers=8)
         self.namespace = os.getenv('K8s_NAMESPACE', 'default')
-        self.minikube_ip = os.getenv('MINIKUBE_IP', '192.168.49.2')
+        # Everything but the metadata and user env of a Blender pod is the same for every user, so build it once
+        self._pod_template = {
+            "apiVersion": "v1",
+            "kind": "Pod",
+            "spec": {
+                "containers": [{
+                    "name": "blender-mcp",
+                    "image": "blender-mcp:latest",
+                    "imagePullPolicy": "IfNotPresent",
+                    "ports": [{"containerPort": BLENDER_PORT}],
+                    "env": [{"name": "PORT", "value": str(BLENDER_PORT)}],
+                    "readinessProbe": {
+                        "httpGet": {"path": HEALTH_PATH, "port": BLENDER_PORT},
+                        "periodSeconds": 1,
+                        "failureThreshold": 30
+                    }
+                }],
+                "restartPolicy": "Never"
+            }
+        }
         try:
             try:
                 config.load_incluster_config()
@@ -18,48 +50,99 @@ class K8sProvider:
             except:
                 config.load_kube_config()
                 logger.info("Loaded K8s config from kubeconfig file")
-            self.core_v1 = client.CoreV1Api()
-            logger.info(f"K8s Provider initialized (namespace: {self.namespace})")
+            # One shared ApiClient with a larger pool so hot-path reads reuse apiserver connections
+            cfg = client.Configuration.get_default_copy()
+            cfg.connection_pool_maxsize = 50
+            self._api_client = client.ApiClient(configuration=cfg)
+            self.core_v1 = client.CoreV1Api(self._api_client)
+            self._ensure_shared_service()
+            logger.info("K8s Provider initialized (namespace: %s)", self.namespace)
         except Exception as e:
-            logger.error(f"Failed to initialize K8s Provider: {e}")
+            logger.error("Failed to initialize K8s Provider: %s", e)
             logger.error("Make sure Kubernetes is running. For local development, run: minikube start")
             logger.error("See .agent/workflows/setup-minikube.md for setup instructions")
             raise
 
-    def wait_for_health(self, url, timeout=30):
-        """Poll the health endpoint until it returns 200 OK."""
-        start_time = time.time()
-        while time.time() - start_time < timeout:
-            try:
-                response = requests.get(f"{url}/health", timeout=2)
-                if response.status_code == 200:
-                    return True
-            except requests.RequestException:
-                pass
-            time.sleep(1)
-        return False
+    @staticmethod
+    def _pod_is_ready(pod):
+        """True once the kubelet reports the pod's readiness probe as passing."""
+        conditions = pod.status.conditions or []
+        return any(c.type == 'Ready' and c.status == 'True' for c in conditions)
+
+    def _wait_pod_ready(self, pod_name, timeout=60):
+        """Watch the pod until it is Ready; returns its IP, or None if it fails or the watch times out."""
+        w = watch.Watch()
+        try:
+            for event in w.stream(
+                self.core_v1.list_namespaced_pod,
+                namespace=self.namespace,
+                field_selector=f"metadata.name={pod_name}",
+                timeout_seconds=timeout
+            ):
+                pod = event['object']
+                if self._pod_is_ready(pod) and pod.status.pod_ip:
+                    return pod.status.pod_ip
+                if pod.status.phase in ('Failed', 'Succeeded'):
+                    return None
+        finally:
+            w.stop()
+        return None
+
+    def _ensure_shared_service(self):
+        """Create the headless Service for Blender pods once; pods are reached by their own IP."""
+        service_manifest = {
+            "apiVersion": "v1",
+            "kind": "Service",
+            "metadata": {
+                "name": SHARED_SERVICE_NAME
+            },
+            "spec": {
+                "clusterIP": "None",
+                "selector": {"app": "blender-mcp"},
+                "ports": [{
+                    "protocol": "TCP",
+                    "port": BLENDER_PORT,
+                    "targetPort": BLENDER_PORT
+                }]
+            }
+        }
+        try:
+            self.core_v1.create_namespaced_service(body=service_manifest, namespace=self.namespace)
+            logger.info("Created shared service %s", SHARED_SERVICE_NAME)
+        except client.exceptions.ApiException as e:
+            if e.status != 409:  # Already exists
+                raise
 
     def get_pod_name(self, user_id):
         return f"blender-{user_id}"
 
     def get_instance_url(self, user_id):
+        cached = self._url_cache.get(user_id)
+        if cached and cached[1] > time.time():
+            return cached[0]
+        
         pod_name = self.get_pod_name(user_id)
-        service_name = f"service-{user_id}"
         try:
-            # Check if pod is running
+            # Only route to pods whose readiness probe passes
             pod = self.core_v1.read_namespaced_pod(name=pod_name, namespace=self.namespace)
-            if pod.status.phase != 'Running':
+            if not self._pod_is_ready(pod) or not pod.status.pod_ip:
                 return None
             
-            # Get Service NodePort
-            service = self.core_v1.read_namespaced_service(name=service_name, namespace=self.namespace)
-            node_port = service.spec.ports[0].node_port
-            return f"http://{self.minikube_ip}:{node_port}"
+            return self._cache_url(user_id, pod.status.pod_ip)
         except client.exceptions.ApiException as e:
             if e.status == 404:
                 return None
             raise
 
+    def _cache_url(self, user_id, pod_ip):
+        url = f"http://{pod_ip}:{BLENDER_PORT}"
+        self._url_cache[user_id] = (url, time.time() + URL_CACHE_TTL)
+        return url
+
+    def invalidate_instance_url(self, user_id):
+        """Forget the cached URL so the next lookup goes to the apiserver."""
+        self._url_cache.pop(user_id, None)
+
     def get_instance_info(self, user_id):
         pod_name = self.get_pod_name(user_id)
         status = "stopped"
@@ -83,109 +166,112 @@ class K8sProvider:
             "provider": "k8s"
         }
 
+    def list_instances(self):
+        """Return {user_id: instance info} for every Blender pod using a single list call."""
+        pods = self.core_v1.list_namespaced_pod(namespace=self.namespace, label_selector="app=blender-mcp")
+        instances = {}
+        for pod in pods.items:
+            user_id = (pod.metadata.labels or {}).get("user")
+            if not user_id:
+                continue
+            url = None
+            if self._pod_is_ready(pod) and pod.status.pod_ip:
+                url = self._cache_url(user_id, pod.status.pod_ip)
+            instances[user_id] = {
+                "instance_id": pod.metadata.name,
+                "status": (pod.status.phase or "unknown").lower(),
+                "url": url,
+                "provider": "k8s"
+            }
+        return instances
+
     def spawn_instance(self, user_id):
         existing_url = self.get_instance_url(user_id)
         if existing_url:
-            if self.wait_for_health(existing_url, timeout=5):
-                return existing_url
+            # Ready pods have already passed the kubelet's health probe
             return existing_url
 
         pod_name = self.get_pod_name(user_id)
-        logger.info(f"Spawning K8s pod {pod_name}")
+        logger.info("Spawning K8s pod %s", pod_name)
         
+        # Only the metadata and user env differ per user; the template is shared and never mutated
+        spec = self._pod_template["spec"]
+        container = spec["containers"][0]
         pod_manifest = {
-            "apiVersion": "v1",
-            "kind": "Pod",
+            **self._pod_template,
             "metadata": {
                 "name": pod_name,
                 "labels": {"app": "blender-mcp", "user": user_id}
             },
             "spec": {
+                **spec,
+                # The pod rejects tool calls for any other user, so a stale (reused) pod IP can't
+                # send one user's calls to another user's scene
                 "containers": [{
-                    "name": "blender-mcp",
-                    "image": "blender-mcp:latest",
-                    "imagePullPolicy": "IfNotPresent",
-                    "ports": [{"containerPort": 8080}],
-                    "env": [{"name": "PORT", "value": "8080"}]
-                }],
-                "restartPolicy": "Never"
-            }
-        }
-
-        service_manifest = {
-            "apiVersion": "v1",
-            "kind": "Service",
-            "metadata": {
-                "name": f"service-{user_id}"
-            },
-            "spec": {
-                "selector": {
-                    "app": "blender-mcp",
-                    "user": user_id
-                },
-                "ports": [{
-                    "protocol": "TCP",
-                    "port": 8080,
-                    "targetPort": 8080,
-                    "nodePort": 0  # Let K8s assign a port
-                }],
-                "type": "NodePort"
+                    **container,
+                    "env": container["env"] + [{"name": "BLENDER_USER_ID", "value": user_id}]
+                }]
             }
         }
 
         try:
-            self.core_v1.create_namespaced_pod(body=pod_manifest, namespace=self.namespace)
-            self.core_v1.create_namespaced_service(body=service_manifest, namespace=self.namespace)
-            
-            # Wait for IP
-            url = None
-            for _ in range(30):
-                url = self.get_instance_url(user_id)
-                if url:
-                    break
-                time.sleep(1)
+            try:
+                self.core_v1.create_namespaced_pod(body=pod_manifest, namespace=self.namespace)
+            except client.exceptions.ApiException as e:
+                if e.status != 409:
+                    raise
+                # The pod exists but isn't ready yet (e.g. another request is spawning it)
+                logger.info("Pod %s already exists, waiting for it to become ready", pod_name)
             
-            if not url:
-                raise Exception("Timeout waiting for Pod IP")
-
-            # Wait for health
-            if self.wait_for_health(url, timeout=60):
-                return url
+            # The kubelet probes the health endpoint; wait for it to mark the pod Ready
+            pod_ip = self._wait_pod_ready(pod_name, timeout=60)
+            if not pod_ip:
+                raise Exception("Timeout waiting for Pod to become ready")
             
-            raise Exception("Pod failed to pass health check")
+            return self._cache_url(user_id, pod_ip)
             
         except Exception as e:
-            logger.error(f"Failed to create pod: {e}")
+            logger.error("Failed to create pod: %s", e)
             raise
 
     def despawn_instance(self, user_id):
         """Delete the Blender instance pod for the given user."""
         pod_name = self.get_pod_name(user_id)
-        logger.info(f"Despawning K8s pod {pod_name}")
+        logger.info("Despawning K8s pod %s", pod_name)
+        self.invalidate_instance_url(user_id)
+        
+        # Return as soon as the apiserver accepts the deletion instead of
+        # waiting out the pod's termination grace period
+        delete_options = client.V1DeleteOptions(propagation_policy='Background', grace_period_seconds=0)
+        
+        # Instances spawned before the shared Service existed also have a
+        # per-user NodePort Service; remove it alongside the pod.
+        legacy_service = self._executor.submit(
+            self.core_v1.delete_namespaced_service,
+            name=f"service-{user_id}",
+            namespace=self.namespace,
+            body=delete_options
+        )
         
         try:
             self.core_v1.delete_namespaced_pod(
                 name=pod_name,
                 namespace=self.namespace,
-                body=client.V1DeleteOptions()
+                body=delete_options
             )
-            try:
-                self.core_v1.delete_namespaced_service(
-                    name=f"service-{user_id}",
-                    namespace=self.namespace,
-                    body=client.V1DeleteOptions()
-                )
-            except client.exceptions.ApiException:
-                pass # Ignore if service doesn't exist
-            logger.info(f"Successfully deleted pod {pod_name}")
+            logger.info("Successfully deleted pod %s", pod_name)
             return True
         except client.exceptions.ApiException as e:
             if e.status == 404:
-                logger.warning(f"Pod {pod_name} not found, already deleted")
+                logger.warning("Pod %s not found, already deleted", pod_name)
                 return False
             else:
-                logger.error(f"Failed to delete pod {pod_name}: {e}")
+                logger.error("Failed to delete pod %s: %s", pod_name, e)
                 raise
         except Exception as e:
-            logger.error(f"Unexpected error deleting pod {pod_name}: {e}")
+            logger.error("Unexpected error deleting pod %s: %s", pod_name, e)
             raise
+        finally:
+            error = legacy_service.exception()
+            if isinstance(error, client.exceptions.ApiException) and error.status != 404:
+                logger.warning("Failed to delete legacy service for user %s: %s", user_id, error)
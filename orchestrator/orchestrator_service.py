@@ -1,33 +1,189 @@
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import requests
+from requests.adapters import HTTPAdapter
 from flask import Response
 
 logger = logging.getLogger(__name__)
 
+# How long an instance that last answered successfully is used without re-checking it
+INSTANCE_CACHE_TTL = 30  # seconds
+
+# Upper bound on tool calls of one batch that are in flight at the same time
+MAX_BATCH_WORKERS = 8
+
+# Spawns run on a small pool so a burst of new users doesn't flood the apiserver
+MAX_SPAWN_WORKERS = 8
+# Spawns beyond this many running or queued are rejected so clients back off
+MAX_PENDING_SPAWNS = 64
+
+
+# Header naming the user a tool call is for; each pod answers with the user it belongs to
+USER_HEADER = "X-Blender-User"
+
+
+class SpawnQueueFull(Exception):
+    """Raised when too many instance spawns are already pending."""
+
+
+class InstanceMismatch(requests.ConnectionError):
+    """The URL now points at a pod that isn't this user's (its IP was reused); the call didn't run there."""
+
+
+def create_http_session(pool_connections=20, pool_maxsize=100, max_retries=3):
+    """
+    Create a keep-alive session so calls to Blender pods reuse their sockets.
+    
+    pool_connections is the number of pods whose connection pools are kept;
+    pool_maxsize caps the concurrent connections to any one pod.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        max_retries=max_retries
+    )
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
 class OrchestratorService:
-    def __init__(self, provider):
+    def __init__(self, provider, session=None):
         self.provider = provider
+        self.session = session or create_http_session()
+        # user_id -> (instance_url, last_ok)
+        self._instances = {}
+        self._instances_lock = threading.Lock()
+        self._batch_executor = ThreadPoolExecutor(max_workers=MAX_BATCH_WORKERS)
+        # user_id -> Future of the spawn in progress, shared by concurrent requests
+        self._spawn_inflight = {}
+        self._spawn_lock = threading.Lock()
+        self._spawn_executor = ThreadPoolExecutor(max_workers=MAX_SPAWN_WORKERS)
 
     def get_instance_info(self, user_id):
         return self.provider.get_instance_info(user_id)
 
-    def execute_tool(self, user_id, tool_name, arguments):
-        # Get or create instance
-        instance_url = self.provider.spawn_instance(user_id)
-        if not instance_url:
-             raise Exception("Failed to get Blender instance URL")
-             
-        logger.info(f"Routing tool {tool_name} for user {user_id} to {instance_url}")
+    def list_instances(self):
+        return self.provider.list_instances()
+
+    def _healthy_instance_url(self, user_id):
+        """Return the instance URL if it answered successfully within INSTANCE_CACHE_TTL."""
+        with self._instances_lock:
+            entry = self._instances.get(user_id)
+        if entry and time.time() - entry[1] < INSTANCE_CACHE_TTL:
+            return entry[0]
+        return None
+
+    def _mark_healthy(self, user_id, instance_url):
+        with self._instances_lock:
+            self._instances[user_id] = (instance_url, time.time())
+
+    def _forget_instance(self, user_id):
+        with self._instances_lock:
+            self._instances.pop(user_id, None)
+        self.provider.invalidate_instance_url(user_id)
+
+    def _run_spawn(self, user_id):
+        try:
+            return self.provider.spawn_instance(user_id)
+        finally:
+            with self._spawn_lock:
+                self._spawn_inflight.pop(user_id, None)
+
+    def _spawn_instance(self, user_id):
+        """Look up the user's instance, or spawn it, joining a spawn already in progress."""
+        # A Ready pod only needs a lookup; keep those out of the bounded spawn pool
+        instance_url = self.provider.get_instance_url(user_id)
+        if instance_url:
+            return instance_url
+        
+        with self._spawn_lock:
+            future = self._spawn_inflight.get(user_id)
+            if future is None:
+                if len(self._spawn_inflight) >= MAX_PENDING_SPAWNS:
+                    raise SpawnQueueFull(f"{len(self._spawn_inflight)} instance spawns already pending")
+                # Stored under the lock, so _run_spawn can't remove it before it is added
+                future = self._spawn_executor.submit(self._run_spawn, user_id)
+                self._spawn_inflight[user_id] = future
+        return future.result()
+
+    def _call_tool(self, user_id, instance_url, tool_name, arguments):
+        logger.info("Routing tool %s for user %s to %s", tool_name, user_id, instance_url)
         
-        # Forward request
-        response = requests.post(
+        # Forward request; the body is streamed so large renders aren't buffered here
+        response = self.session.post(
             f"{instance_url}/tools/call",
             json={"name": tool_name, "arguments": arguments},
-            timeout=60
+            headers={USER_HEADER: user_id},
+            timeout=60,
+            stream=True
         )
         
+        # Pod IPs are reused, so make sure the pod that answered is this user's
+        owner = response.headers.get(USER_HEADER)
+        if owner != user_id:
+            response.close()
+            self._forget_instance(user_id)
+            raise InstanceMismatch(f"{instance_url} belongs to user {owner!r}, not {user_id}")
+        
+        if response.status_code >= 500:
+            self._forget_instance(user_id)
+        else:
+            self._mark_healthy(user_id, instance_url)
         return response
 
+    def execute_tool(self, user_id, tool_name, arguments):
+        # Fast path: the instance answered recently, skip the spawn/health probe
+        instance_url = self._healthy_instance_url(user_id)
+        if instance_url:
+            try:
+                return self._call_tool(user_id, instance_url, tool_name, arguments)
+            except requests.ConnectionError as e:
+                # The call never ran (unreachable, or rejected by another user's pod),
+                # so it is safe to resolve the instance again and retry
+                logger.warning("Cached instance for user %s unusable: %s", user_id, e)
+                self._forget_instance(user_id)
+        
+        # Get or create instance
+        instance_url = self._spawn_instance(user_id)
+        if not instance_url:
+             raise Exception("Failed to get Blender instance URL")
+        
+        return self._call_tool(user_id, instance_url, tool_name, arguments)
+
+    def execute_tools_batch(self, user_id, calls):
+        """
+        Run independent tool calls concurrently on the user's instance.
+        
+        calls is a list of {"tool_name", "arguments"} dicts. Returns one result per
+        call, in order: the tool's JSON response, or an error dict.
+        """
+        # Bring the instance up before fanning out, so a full spawn queue rejects the whole batch
+        if not self._healthy_instance_url(user_id):
+            self._spawn_instance(user_id)
+        
+        def run(call):
+            try:
+                # Routed like a single call: an unreachable cached instance is evicted and re-resolved
+                response = self.execute_tool(user_id, call['tool_name'], call.get('arguments'))
+                try:
+                    if not response.ok:
+                        return {"status": "error", "message": f"Tool call failed with HTTP {response.status_code}: {response.text}"}
+                    return response.json()
+                finally:
+                    response.close()
+            except Exception as e:
+                logger.error("Batched tool %s failed for user %s: %s", call['tool_name'], user_id, e)
+                return {"status": "error", "message": str(e)}
+        
+        # map() yields in submission order, so results line up with calls
+        return list(self._batch_executor.map(run, calls))
+
     def despawn_instance(self, user_id):
         """Despawn the Blender instance for the given user."""
+        with self._instances_lock:
+            self._instances.pop(user_id, None)
         return self.provider.despawn_instance(user_id)